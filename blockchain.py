@@ -1,24 +1,31 @@
 # Standard library imports
 import hashlib
-import json
 import os
 import time
 import logging
-import re
 import socket
+import multiprocessing
+import queue
+from itertools import zip_longest
 
 # Third-party imports
-from cryptography.hazmat.primitives import serialization, hashes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
-from cryptography.hazmat.primitives.asymmetric import ec
+import orjson
 from dotenv import load_dotenv
 
 # Network constants for peer-to-peer communication
 PORT = 5000
 BUFFER_SIZE = 4096
 
+# Blocks are appended to a log between full snapshots taken every SNAPSHOT_INTERVAL blocks
+SNAPSHOT_INTERVAL = 100
+
+# Transaction amounts must fit the 64-bit integers that orjson can serialize
+MIN_AMOUNT = -(2 ** 63)
+MAX_AMOUNT = 2 ** 64 - 1
+
+# Number of child hashes combined into each internal Merkle node
+MERKLE_ARITY = 4
+
 # Setup logging
 logging.basicConfig(
     filename='blockchain.log',
@@ -30,16 +37,56 @@ logging.basicConfig(
 # Load environment variables
 load_dotenv()
 
+# Number of processes searching nonces in parallel; the default keeps mining in-process
+# and 0 uses one process per CPU
+MINING_WORKERS = int(os.getenv("MINING_WORKERS", "1"))
+
+# SHA-256 constructor used on every hashing path. hashlib is backed by OpenSSL,
+# whose libcrypto selects the SHA-NI / AVX2 compression routine for the running
+# CPU at load time, so binding it once here is all the dispatch we need.
+sha256 = hashlib.sha256
+
+def hash_data(data):
+    """Hashes the given bytes using SHA-256 and returns the raw 32-byte digest."""
+    return sha256(data).digest()
+
+def hash_many(buffers):
+    """Hashes a batch of independent buffers, returning their digests in order."""
+    return [sha256(buffer).digest() for buffer in buffers]
+
+def hash_level(layer):
+    """Hashes each group of MERKLE_ARITY adjacent nodes in a Merkle level into the parent level."""
+    nodes = iter(layer)
+    # Pad a short final group by repeating the last node
+    groups = zip_longest(*[nodes] * MERKLE_ARITY, fillvalue=layer[-1])
+    return [sha256(b"".join(group)).digest() for group in groups]
+
 class Transaction:
     """Represents a transaction in the blockchain."""
+    __slots__ = ("sender", "receiver", "amount", "_encoding")
+
     def __init__(self, sender, receiver, amount):
         self.sender = sender
         self.receiver = receiver
         self.amount = amount
 
+    def __setattr__(self, name, value):
+        if name == "amount" and isinstance(value, int) and not MIN_AMOUNT <= value <= MAX_AMOUNT:
+            raise ValueError(f"Transaction amount {value} is outside the 64-bit integer range.")
+        # Changing any transaction field invalidates the cached encoding
+        if name != "_encoding":
+            super().__setattr__("_encoding", None)
+        super().__setattr__(name, value)
+
     def __repr__(self):
         return f"Transaction({self.sender} -> {self.receiver}: {self.amount})"
 
+    def _encoded(self):
+        """Returns the canonical bytes hashed into the Merkle tree, encoding them on first use."""
+        if self._encoding is None:
+            self._encoding = repr(self).encode()
+        return self._encoding
+
     def to_dict(self):
         """Converts the transaction to a dictionary representation."""
         return {"sender": self.sender, "receiver": self.receiver, "amount": self.amount}
@@ -48,23 +95,67 @@ class MerkleTree:
     """Constructs a Merkle Tree from a list of transactions."""
     def __init__(self, transactions):
         self.transactions = transactions
-        self.root = self.build_tree([self.hash_data(str(tx)) for tx in transactions])
+        self.root = self.build_tree(hash_many([tx._encoded() for tx in transactions]))
 
-    @staticmethod
-    def hash_data(data):
-        """Hashes the given data using SHA-256."""
-        return hashlib.sha256(data.encode()).hexdigest()
+    hash_data = staticmethod(hash_data)
 
     def build_tree(self, leaves):
         """Builds the Merkle Tree iteratively from the leaves."""
-        while len(leaves) > 1:
-            # If odd number of leaves, duplicate the last leaf
-            if len(leaves) % 2 == 1:
-                leaves.append(leaves[-1])
-            # Create parent layer by hashing pairs of leaves
-            parent_layer = [self.hash_data(leaves[i] + leaves[i + 1]) for i in range(0, len(leaves), 2)]
-            leaves = parent_layer
-        return leaves[0] if leaves else None
+        layer = leaves
+        while len(layer) > 1:
+            layer = hash_level(layer)
+        return layer[0] if layer else None
+
+# Pre-encoded last three decimal digits of a nonce, unpadded for nonces below 1000
+_NONCE_TAILS = tuple(b"%d" % i for i in range(1000))
+_NONCE_TAILS_PADDED = tuple(b"%03d" % i for i in range(1000))
+
+def difficulty_target(difficulty):
+    """Returns the bound a raw block hash must be below to start with `difficulty` zero hex digits."""
+    if difficulty <= 0:
+        # Longer than any digest and all 0xff, so every 32-byte hash sorts below it
+        return b"\xff" * 33
+    if difficulty > 64:
+        raise ValueError(f"Difficulty {difficulty} exceeds the 64 hex digits of a SHA-256 hash.")
+    return (1 << (256 - 4 * difficulty)).to_bytes(32, "big")
+
+def _search_nonce(prefix, difficulty, start, step=1, stop=None):
+    """Searches nonces from start in groups of 1000, advancing step groups at a time.
+
+    Returns the winning (nonce, hash), or None once the stop event is set.
+    """
+    # A single bytes comparison checks the leading zero digits without hex-encoding the digest
+    target = difficulty_target(difficulty)
+    # The prefix is hashed once; each attempt resumes from a copy of that state
+    prefix_state = sha256(prefix)
+    high, low = divmod(start, 1000)
+    while stop is None or not stop.is_set():
+        # Fold the nonce digits above the last three into the midstate once per 1000 attempts
+        if high:
+            midstate = prefix_state.copy()
+            midstate.update(b"%d" % high)
+            tails = _NONCE_TAILS_PADDED
+        else:
+            midstate, tails = prefix_state, _NONCE_TAILS
+        copy = midstate.copy
+        for low in range(low, 1000):
+            attempt = copy()
+            attempt.update(tails[low])
+            block_hash = attempt.digest()
+            if block_hash < target:
+                return high * 1000 + low, block_hash
+        high, low = high + step, 0
+    return None
+
+def _mine_worker(prefix, difficulty, start, step, stop, results):
+    """Runs one share of a parallel nonce search and reports a win through the results queue."""
+    found = _search_nonce(prefix, difficulty, start, step, stop)
+    if found:
+        results.put(found)
+        stop.set()
+
+# Block attributes whose change means the block hash has to be checked again
+_HASHED_FIELDS = frozenset({"index", "previous_hash", "transactions", "merkle_root", "timestamp", "nonce", "hash"})
 
 class Block:
     """Represents a block in the blockchain."""
@@ -74,20 +165,103 @@ class Block:
         self.transactions = transactions
         self.timestamp = timestamp or int(time.time())
         self.nonce = nonce
-        self.merkle_root = MerkleTree(transactions).root
-        self.hash = self.calculate_hash()
+        self._hash = None
+
+    def __setattr__(self, name, value):
+        # Changing a hashed field or the stored hash voids an earlier successful validation
+        if name in _HASHED_FIELDS:
+            super().__setattr__("_verified", False)
+        # Replacing the transactions invalidates the cached Merkle root
+        if name == "transactions":
+            super().__setattr__("_merkle_root", None)
+        super().__setattr__(name, value)
+
+    @property
+    def merkle_root(self):
+        """Merkle root of the block's transactions, built on first use."""
+        if self._merkle_root is None:
+            self._merkle_root = MerkleTree(self.transactions).root
+        return self._merkle_root
+
+    @merkle_root.setter
+    def merkle_root(self, value):
+        self._merkle_root = value
+
+    @property
+    def hash(self):
+        """Stored block hash, calculated from the header on first use if none was assigned."""
+        if self._hash is None:
+            self._hash = self.calculate_hash()
+        return self._hash
+
+    @hash.setter
+    def hash(self, value):
+        self._hash = value
+
+    def header_prefix(self):
+        """Returns the part of the block header that does not change while mining."""
+        return b"%d%b%b%d" % (self.index, self.previous_hash, self.merkle_root or b"", self.timestamp)
+
+    def header(self):
+        """Returns the full block header that the block hash commits to."""
+        return self.header_prefix() + b"%d" % self.nonce
 
     def calculate_hash(self):
         """Calculates the SHA-256 hash of the block."""
-        block_string = f"{self.index}{self.previous_hash}{self.merkle_root}{self.timestamp}{self.nonce}".encode()
-        return hashlib.sha256(block_string).hexdigest()
+        return hash_data(self.header())
 
-    def mine_block(self, difficulty):
+    def hash_is_current(self):
+        """Checks the stored hash against the header, remembering a match until a hashed field changes."""
+        if not self._verified:
+            self._verified = self.hash == self.calculate_hash()
+        return self._verified
+
+    def mine_block(self, difficulty, workers=None):
         """Mines the block by finding a hash that meets the difficulty target."""
-        target = "0" * difficulty
-        while self.hash[:difficulty] != target:
-            self.nonce += 1
-            self.hash = self.calculate_hash()
+        if workers is None:
+            workers = MINING_WORKERS
+        if workers == 0:
+            workers = os.cpu_count() or 1
+        if workers > 1:
+            self.nonce, self.hash = self._mine_parallel(difficulty, workers)
+        else:
+            self.nonce, self.hash = _search_nonce(self.header_prefix(), difficulty, self.nonce)
+        # The hash was just computed from this header, so validation need not redo it
+        self._verified = True
+
+    def _mine_parallel(self, difficulty, workers):
+        """Searches disjoint nonce ranges in worker processes and returns the first win."""
+        # Reject an unreachable difficulty before any worker starts, as the serial search does
+        difficulty_target(difficulty)
+        prefix = self.header_prefix()
+        stop = multiprocessing.Event()
+        results = multiprocessing.Queue()
+        # Worker i searches groups of 1000 nonces starting i groups ahead, so no two overlap
+        first_group = self.nonce // 1000
+        processes = [
+            multiprocessing.Process(
+                target=_mine_worker,
+                args=(prefix, difficulty, self.nonce if i == 0 else (first_group + i) * 1000,
+                      workers, stop, results),
+                daemon=True
+            )
+            for i in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        try:
+            while True:
+                # Checked before waiting so a result queued by the last worker is still read
+                finished = not any(process.is_alive() for process in processes)
+                try:
+                    return results.get(timeout=0.1)
+                except queue.Empty:
+                    if finished:
+                        raise RuntimeError("All mining workers exited without finding a nonce.")
+        finally:
+            stop.set()
+            for process in processes:
+                process.join()
 
 class Blockchain:
     """Represents the blockchain itself, managing the chain of blocks."""
@@ -95,11 +269,14 @@ class Blockchain:
         self.chain = [self.create_genesis_block()]
         self.difficulty = difficulty
         self.filename = filename
+        self.log_filename = os.path.splitext(filename)[0] + ".ndjson"
+        # Whether the snapshot and the block log on disk together hold the current chain
+        self._persisted = False
         self.load_chain()
 
     def create_genesis_block(self):
         """Creates the first block in the blockchain."""
-        return Block(0, "0", [], nonce=0)
+        return Block(0, bytes(32), [], nonce=0)
 
     def get_latest_block(self):
         """Returns the latest block in the blockchain."""
@@ -110,67 +287,127 @@ class Blockchain:
         new_block.previous_hash = self.get_latest_block().hash
         new_block.mine_block(self.difficulty)
         self.chain.append(new_block)
-        self.save_chain()
+        if len(self.chain) % SNAPSHOT_INTERVAL == 0 or not self._persisted:
+            self.save_chain()
+        else:
+            self.append_block(new_block)
 
     def save_chain(self):
-        """Saves the blockchain to a JSON file."""
+        """Saves a snapshot of the whole blockchain to a JSON file and clears the block log."""
         try:
-            with open(self.filename, "w") as f:
-                json.dump([self.block_to_dict(block) for block in self.chain], f, indent=4)
+            temp_filename = f"{self.filename}.tmp"
+            with open(temp_filename, "wb") as f:
+                f.write(orjson.dumps([self.block_to_dict(block) for block in self.chain], option=orjson.OPT_INDENT_2))
+            os.replace(temp_filename, self.filename)
+            # Every logged block is in the snapshot now
+            open(self.log_filename, "w").close()
+            self._persisted = True
             logging.info("Blockchain saved successfully.")
         except (IOError, Exception) as e:
+            # The chain on disk is incomplete, so the next block retries a full snapshot
+            self._persisted = False
             logging.error(f"Failed to save blockchain to file: {e}")
 
+    def append_block(self, block):
+        """Appends a single block to the newline-delimited JSON block log."""
+        try:
+            with open(self.log_filename, "ab") as f:
+                f.write(orjson.dumps(self.block_to_dict(block)) + b"\n")
+        except (IOError, Exception) as e:
+            # The log now has a gap, so the next block is saved as a full snapshot
+            self._persisted = False
+            logging.error(f"Failed to append block to log: {e}")
+
     def load_chain(self):
-        """Loads the blockchain from a JSON file."""
+        """Loads the blockchain from the JSON snapshot and replays the block log on top of it."""
         try:
-            with open(self.filename, "r") as f:
-                data = json.load(f)
+            with open(self.filename, "rb") as f:
+                data = orjson.loads(f.read())
                 self.chain = [self.dict_to_block(block_data) for block_data in data]
+            self._persisted = self.replay_log()
             logging.info("Blockchain loaded successfully.")
         except FileNotFoundError:
             logging.warning(f"No blockchain file found at {self.filename}. Starting with the genesis block.")
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logging.error(f"Failed to decode JSON while loading blockchain: {e}")
         except IOError as e:
             logging.error(f"Failed to load blockchain from file: {e}")
         except Exception as e:
             logging.error(f"Unexpected error while loading blockchain: {e}")
 
+    def replay_log(self):
+        """Appends the logged blocks that extend the loaded snapshot.
+
+        Returns False if the log ends in a partially written entry or has a gap,
+        so the next block is saved as a full snapshot instead of appended after it.
+        """
+        known_hashes = {block.hash for block in self.chain}
+        try:
+            with open(self.log_filename, "rb") as f:
+                for line in f:
+                    block = self.dict_to_block(orjson.loads(line))
+                    # Blocks already in the snapshot are left over from an interrupted save
+                    if block.hash in known_hashes:
+                        continue
+                    if block.previous_hash != self.chain[-1].hash:
+                        logging.warning(f"Stopped replaying block log at block {block.index}: it does not extend the chain.")
+                        return False
+                    self.chain.append(block)
+                    known_hashes.add(block.hash)
+        except FileNotFoundError:
+            pass
+        except orjson.JSONDecodeError as e:
+            logging.warning(f"Stopped replaying block log at a partially written entry: {e}")
+            return False
+        return True
+
     @staticmethod
     def block_to_dict(block):
-        """Converts a block to a dictionary representation."""
+        """Converts a block to a dictionary representation with hex-encoded hashes."""
         return {
             "index": block.index,
-            "previous_hash": block.previous_hash,
+            "previous_hash": block.previous_hash.hex(),
             "transactions": [tx.to_dict() for tx in block.transactions],
             "timestamp": block.timestamp,
             "nonce": block.nonce,
-            "merkle_root": block.merkle_root,
-            "hash": block.hash
+            "merkle_root": block.merkle_root.hex() if block.merkle_root else None,
+            "hash": block.hash.hex()
         }
 
     def dict_to_block(self, block_dict):
         """Converts a dictionary representation back to a block."""
         transactions = [Transaction(**tx) for tx in block_dict["transactions"]]
-        block = Block(block_dict["index"], block_dict["previous_hash"], transactions,
+        block = Block(block_dict["index"], bytes.fromhex(block_dict["previous_hash"]), transactions,
                       block_dict["timestamp"], block_dict["nonce"])
-        block.hash = block_dict["hash"]
+        block.hash = bytes.fromhex(block_dict["hash"])
         return block
 
     def is_chain_valid(self):
         """Validates the blockchain by checking hashes and previous hashes."""
-        for i in range(1, len(self.chain)):
-            current_block = self.chain[i]
-            previous_block = self.chain[i - 1]
-            if current_block.hash != current_block.calculate_hash():
-                logging.error(f"Invalid block at index {i}: hash mismatch.")
-                return False
-            if current_block.previous_hash != previous_block.hash:
-                logging.error(f"Invalid block at index {i}: previous hash mismatch.")
-                return False
+        invalid = self.find_invalid_block(self.chain)
+        if invalid:
+            index, reason = invalid
+            logging.error(f"Invalid block at index {index}: {reason}.")
+            return False
         return True
 
+    @staticmethod
+    def find_invalid_block(chain):
+        """Returns (index, reason) for the first invalid block in a chain, or None if it is valid."""
+        blocks = chain[1:]
+        mismatched = {id(block) for block in blocks if not block.hash_is_current()}
+        # Compare links as flat columns so the all-valid case is a single list compare
+        links = [block.previous_hash for block in blocks]
+        parents = [block.hash for block in chain[:-1]]
+        if not mismatched and links == parents:
+            return None
+        for i, block in enumerate(blocks, 1):
+            if id(block) in mismatched:
+                return i, "hash mismatch"
+            if links[i - 1] != parents[i - 1]:
+                return i, "previous hash mismatch"
+        return None
+
     def connect_to_blockchain(self, host):
         """Connect to a peer's blockchain and sync if their chain is longer."""
         try:
@@ -184,7 +421,7 @@ class Blockchain:
                         break
                     data += part
 
-                received_chain = json.loads(data.decode())
+                received_chain = orjson.loads(data)
                 received_chain_objects = [self.dict_to_block(block) for block in received_chain]
 
                 if self.is_valid_chain(received_chain_objects) and len(received_chain_objects) > len(self.chain):
@@ -196,21 +433,14 @@ class Blockchain:
 
         except socket.error as e:
             logging.error(f"Failed to connect to {host}:{PORT} - {e}")
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logging.error(f"Failed to decode blockchain JSON data from {host}:{PORT} - {e}")
         except Exception as e:
             logging.error(f"Unexpected error while connecting to blockchain: {e}")
 
     def is_valid_chain(self, chain):
         """Check if a given chain is valid by verifying hashes and previous hashes."""
-        for i in range(1, len(chain)):
-            current_block = chain[i]
-            previous_block = chain[i - 1]
-            if current_block.hash != current_block.calculate_hash():
-                return False
-            if current_block.previous_hash != previous_block.hash:
-                return False
-        return True
+        return self.find_invalid_block(chain) is None
 
 # Server function for peer-to-peer communication
 
@@ -228,8 +458,8 @@ def start_server(blockchain):
                     request = client_socket.recv(BUFFER_SIZE).decode()
 
                     if request == "REQUEST_BLOCKCHAIN":
-                        blockchain_data = json.dumps([blockchain.block_to_dict(block) for block in blockchain.chain])
-                        client_socket.sendall(blockchain_data.encode())
+                        blockchain_data = orjson.dumps([blockchain.block_to_dict(block) for block in blockchain.chain])
+                        client_socket.sendall(blockchain_data)
                         logging.info(f"Sent blockchain to peer at {address}")
             except Exception as e:
                 logging.error(f"Error handling client connection: {e}")
@@ -11,7 +11,8 @@ blockchain = Blockchain(difficulty=2)
 # Home route to display dashboard
 @app.route('/')
 def index():
-    return render_template("index.html", blockchain=blockchain.chain)
+    chain_data = [blockchain.block_to_dict(block) for block in blockchain.chain]
+    return render_template("index.html", blockchain=chain_data)
 
 # Route to view full blockchain
 @app.route('/blockchain', methods=['GET'])
@@ -27,7 +28,11 @@ def new_transaction():
     amount = request.form.get("amount")
     
     if sender and receiver and amount:
-        transaction = Transaction(sender, receiver, int(amount))
+        try:
+            transaction = Transaction(sender, receiver, int(amount))
+        except ValueError as e:
+            logging.warning(f"Rejected transaction: {e}")
+            return redirect(url_for('index'))
         new_block = Block(
             index=len(blockchain.chain),
             previous_hash=blockchain.get_latest_block().hash,
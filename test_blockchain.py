@@ -1,26 +1,27 @@
 import pytest
+import blockchain
 from blockchain import Blockchain, Block, Transaction, MerkleTree
 
-def test_create_genesis_block():
+def test_create_genesis_block(tmp_path):
     # Test creation of the genesis block in the blockchain
-    blockchain = Blockchain()
+    blockchain = Blockchain(filename=str(tmp_path / "chain.json"))
     genesis_block = blockchain.create_genesis_block()
     assert genesis_block is not None
-    assert genesis_block.previous_hash == "0"
+    assert genesis_block.previous_hash == bytes(32)
     assert genesis_block.index == 0
 
-def test_add_block():
+def test_add_block(tmp_path):
     # Test adding a block to the blockchain
-    blockchain = Blockchain()
+    blockchain = Blockchain(filename=str(tmp_path / "chain.json"))
     genesis_block = blockchain.create_genesis_block()
     new_block = Block(1, genesis_block.hash, [Transaction("Alice", "Bob", 10)])
     blockchain.add_block(new_block)
     assert blockchain.get_latest_block().previous_hash == genesis_block.hash
     assert blockchain.get_latest_block().index == genesis_block.index + 1
 
-def test_is_chain_valid():
+def test_is_chain_valid(tmp_path):
     # Test validation of a tampered blockchain
-    blockchain = Blockchain()
+    blockchain = Blockchain(filename=str(tmp_path / "chain.json"))
     genesis_block = blockchain.create_genesis_block()
     new_block = Block(1, genesis_block.hash, [Transaction("Alice", "Bob", 10)])
     blockchain.add_block(new_block)
@@ -30,10 +31,137 @@ def test_is_chain_valid():
     blockchain.chain[1].transactions = [Transaction("Alice", "Mallory", 100)]
     assert not blockchain.is_chain_valid()  # Now should be invalid
 
+def test_is_chain_valid_after_header_edit(tmp_path):
+    # Test that editing the nonce or previous hash of an already validated block is caught
+    blockchain = Blockchain(filename=str(tmp_path / "chain.json"))
+    blockchain.add_block(Block(1, bytes(32), [Transaction("Alice", "Bob", 10)]))
+    block = blockchain.chain[1]
+    assert blockchain.is_chain_valid()
+    block.nonce += 1
+    assert not blockchain.is_chain_valid()
+    block.nonce -= 1
+    assert blockchain.is_chain_valid()
+    block.previous_hash = bytes(32)
+    assert not blockchain.is_chain_valid()
+
+def test_is_chain_valid_after_transaction_edit(tmp_path):
+    # Test that editing a transaction's fields in place is caught once the block's transactions are reassigned
+    blockchain = Blockchain(filename=str(tmp_path / "chain.json"))
+    transaction = Transaction("Alice", "Bob", 10)
+    blockchain.add_block(Block(1, bytes(32), [transaction]))
+    assert blockchain.is_chain_valid()
+    transaction.amount = 10_000
+    blockchain.chain[1].transactions = [transaction]
+    assert not blockchain.is_chain_valid()
+
 def test_merkle_tree():
     # Test the Merkle Tree functionality
     transactions = [Transaction("Alice", "Bob", 10), Transaction("Bob", "Alice", 5)]
     merkle_tree = MerkleTree(transactions)
     assert merkle_tree.root is not None  # Check Merkle root is generated
 
+def test_mine_block():
+    # Test that mining finds a hash meeting the difficulty that matches the block contents
+    block = Block(1, bytes(32), [Transaction("Alice", "Bob", 10)])
+    block.mine_block(3)
+    assert block.hash.hex().startswith("000")
+    assert block.hash == block.calculate_hash()
+
+def test_mine_block_parallel():
+    # Test that a parallel nonce search produces a valid block
+    block = Block(1, bytes(32), [Transaction("Alice", "Bob", 10)])
+    block.mine_block(3, workers=2)
+    assert block.hash.hex().startswith("000")
+    assert block.hash == block.calculate_hash()
+
+def test_save_and_load_chain(tmp_path, monkeypatch):
+    # Test that blocks survive a reload from the snapshot plus the block log
+    monkeypatch.setattr(blockchain, "SNAPSHOT_INTERVAL", 3)
+    filename = str(tmp_path / "chain.json")
+    chain = Blockchain(difficulty=1, filename=filename)
+    for i in range(4):
+        chain.add_block(Block(i + 1, bytes(32), [Transaction("Alice", "Bob", i)]))
+    assert len((tmp_path / "chain.ndjson").read_text().splitlines()) == 2
+    reloaded = Blockchain(difficulty=1, filename=filename)
+    assert [block.hash for block in reloaded.chain] == [block.hash for block in chain.chain]
+    assert reloaded.is_chain_valid()
+
+def test_merkle_tree_arity():
+    # Test that each internal node hashes four children, padding with the last child
+    transactions = [Transaction("Alice", "Bob", i) for i in range(5)]
+    leaves = [MerkleTree.hash_data(str(tx).encode()) for tx in transactions]
+    first = MerkleTree.hash_data(b"".join(leaves[:4]))
+    second = MerkleTree.hash_data(leaves[4] * 4)
+    expected = MerkleTree.hash_data(first + second * 3)
+    assert MerkleTree(transactions).root == expected
+
+def test_mine_block_parallel_rejects_unreachable_difficulty():
+    # Test that an impossible difficulty fails before any worker starts instead of hanging
+    block = Block(1, bytes(32), [Transaction("Alice", "Bob", 10)])
+    with pytest.raises(ValueError):
+        block.mine_block(65, workers=2)
+
+def test_mine_block_zero_workers_uses_every_cpu(monkeypatch):
+    # Test that zero workers, passed directly or through MINING_WORKERS, means one process per CPU
+    calls = []
+    monkeypatch.setattr(blockchain.os, "cpu_count", lambda: 3)
+    monkeypatch.setattr(Block, "_mine_parallel", lambda self, difficulty, workers: calls.append(workers) or (0, bytes(32)))
+    Block(1, bytes(32), []).mine_block(1, workers=0)
+    monkeypatch.setattr(blockchain, "MINING_WORKERS", 0)
+    Block(1, bytes(32), []).mine_block(1)
+    assert calls == [3, 3]
+
+def test_load_chain_replays_log_by_link(tmp_path):
+    # Test that logged blocks are replayed by their link to the tip, whatever their index field says
+    filename = str(tmp_path / "chain.json")
+    chain = Blockchain(difficulty=1, filename=filename)
+    chain.add_block(Block(1, bytes(32), [Transaction("Alice", "Bob", 1)]))
+    chain.add_block(Block(1, bytes(32), [Transaction("Alice", "Bob", 2)]))
+    reloaded = Blockchain(difficulty=1, filename=filename)
+    assert [block.hash for block in reloaded.chain] == [block.hash for block in chain.chain]
+
+def test_add_block_snapshots_after_failed_load(tmp_path):
+    # Test that blocks added after an unreadable snapshot are saved in a fresh snapshot
+    snapshot = tmp_path / "chain.json"
+    snapshot.write_text('[{"index": 0, "previous_hash": "0", "transactions": [], "timestamp": 1, "nonce": 0, '
+                        '"merkle_root": null, "hash": "00"}]')
+    chain = Blockchain(difficulty=1, filename=str(snapshot))
+    assert len(chain.chain) == 1
+    for i in range(3):
+        chain.add_block(Block(i + 1, bytes(32), [Transaction("Alice", "Bob", i)]))
+    reloaded = Blockchain(difficulty=1, filename=str(snapshot))
+    assert [block.hash for block in reloaded.chain] == [block.hash for block in chain.chain]
+    assert reloaded.is_chain_valid()
+
+def test_add_block_snapshots_after_failed_append(tmp_path):
+    # Test that a failed log append makes the next block save a full snapshot instead of leaving a gap
+    filename = str(tmp_path / "chain.json")
+    chain = Blockchain(difficulty=1, filename=filename)
+    chain.add_block(Block(1, bytes(32), [Transaction("Alice", "Bob", 1)]))
+    log = tmp_path / "chain.ndjson"
+    log.unlink()
+    log.mkdir()
+    chain.add_block(Block(2, bytes(32), [Transaction("Alice", "Bob", 2)]))
+    log.rmdir()
+    chain.add_block(Block(3, bytes(32), [Transaction("Alice", "Bob", 3)]))
+    reloaded = Blockchain(difficulty=1, filename=filename)
+    assert [block.hash for block in reloaded.chain] == [block.hash for block in chain.chain]
+
+def test_assign_merkle_root(tmp_path):
+    # Test that merkle_root can still be assigned and that doing so is caught by validation
+    blockchain = Blockchain(difficulty=1, filename=str(tmp_path / "chain.json"))
+    blockchain.add_block(Block(1, bytes(32), [Transaction("Alice", "Bob", 10)]))
+    assert blockchain.is_chain_valid()
+    blockchain.chain[1].merkle_root = bytes(32)
+    assert blockchain.chain[1].merkle_root == bytes(32)
+    assert not blockchain.is_chain_valid()
 
+def test_transaction_rejects_out_of_range_amount():
+    # Test that amounts that cannot be serialized as 64-bit integers are refused
+    with pytest.raises(ValueError):
+        Transaction("Alice", "Bob", 2 ** 64)
+    with pytest.raises(ValueError):
+        Transaction("Alice", "Bob", -(2 ** 63) - 1)
+    transaction = Transaction("Alice", "Bob", 2 ** 64 - 1)
+    with pytest.raises(ValueError):
+        transaction.amount = 2 ** 64